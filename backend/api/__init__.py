@@ -6,3 +6,4 @@ from . import submit_job    # noqa: F401
 from . import get_status    # noqa: F401
 from . import fetch_result   # noqa: F401
 from . import download_audio  # noqa: F401
+from . import stream_status   # noqa: F401
@@ -2,24 +2,26 @@
 
 import os
 import sys
-from typing import Iterator
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from fastapi import HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, Response
 from modal import fastapi_endpoint
 
 from modal_app import app, backend_image, JOB_STORE, AUDIO_VOLUME
 
+# When served behind nginx, set this to the internal location that maps to
+# /audio (e.g. "/internal/audio/") so nginx streams the file itself.
+ACCEL_REDIRECT_PREFIX = os.environ.get("AUDIO_ACCEL_REDIRECT_PREFIX")
 
-def _iter_file_chunks(path: str) -> Iterator[bytes]:
-    with open(path, "rb") as f:
-        while True:
-            chunk = f.read(64 * 1024)
-            if not chunk:
-                break
-            yield chunk
+# Read size per chunk when streaming; larger reads mean fewer syscalls and
+# fewer ASGI sends per MB of WAV.
+AUDIO_STREAM_CHUNK_BYTES = int(os.environ.get("AUDIO_STREAM_CHUNK_BYTES", 1 << 20))
+
+
+class _AudioFileResponse(FileResponse):
+    chunk_size = AUDIO_STREAM_CHUNK_BYTES
 
 
 @app.function(
@@ -28,16 +30,18 @@ def _iter_file_chunks(path: str) -> Iterator[bytes]:
     volumes={"/audio": AUDIO_VOLUME},
 )
 @fastapi_endpoint(method="GET")
-def download_audio(job_id: str):
+async def download_audio(job_id: str):
     """
     GET /download_audio?job_id=...
 
-    Streams the generated audio file for the given job.
+    Serves the generated audio file for the given job. Honors
+    `Range: bytes=...` (206 Partial Content) so <audio> players can seek
+    without re-downloading the whole WAV.
     """
-    if job_id not in JOB_STORE:
+    job = await JOB_STORE.get.aio(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    job = JOB_STORE[job_id]
     if job.get("status") != "complete":
         raise HTTPException(status_code=404, detail="Audio not ready")
 
@@ -50,13 +54,23 @@ def download_audio(job_id: str):
 
     filename = job.get("audio_filename") or os.path.basename(audio_path)
 
-    headers = {
-        "Content-Disposition": f'inline; filename="{filename}"',
-        "Cache-Control": "public, max-age=3600",
-    }
+    cache_headers = {"Cache-Control": "public, max-age=3600"}
+
+    if ACCEL_REDIRECT_PREFIX:
+        # Empty body: nginx resolves the internal location and sends the file
+        headers = {
+            **cache_headers,
+            "Content-Disposition": f'inline; filename="{filename}"',
+            "X-Accel-Redirect": (
+                ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + os.path.basename(audio_path)
+            ),
+        }
+        return Response(media_type="audio/wav", headers=headers)
 
-    return StreamingResponse(
-        _iter_file_chunks(audio_path),
+    return _AudioFileResponse(
+        audio_path,
         media_type="audio/wav",
-        headers=headers,
+        filename=filename,
+        content_disposition_type="inline",
+        headers=cache_headers,
     )
@@ -2,17 +2,48 @@
 
 import sys
 import os
+from typing import Any, Dict
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from fastapi import HTTPException
 from modal import fastapi_endpoint
 
-from modal_app import app, backend_image, JOB_STORE
+from modal_app import app, backend_image, JOB_STORE, get_job_status
+
+# Completed jobs are never rewritten, so their payloads are safe to keep
+# in-process for repeat polls (oldest entry evicted first).
+_COMPLETED_RESULTS: Dict[str, Dict[str, Any]] = {}
+_COMPLETED_RESULTS_MAX = 256
+
+
+async def _completed_result(job_id: str) -> Dict[str, Any]:
+    cached = _COMPLETED_RESULTS.get(job_id)
+    if cached is not None:
+        return cached
+
+    job = await JOB_STORE.get.aio(job_id)
+    result = {
+        "job_id": job.get("job_id"),
+        "status": "complete",
+        "genre": job.get("genre"),
+        "mood": job.get("mood"),
+        "captions": job.get("captions"),
+        "summary": job.get("summary"),
+        "lyrics": job.get("lyrics"),
+        "audio_path": job.get("audio_url") or job.get("audio_path"),
+        "audio_url": job.get("audio_url") or job.get("audio_path"),
+        "audio_filename": job.get("audio_filename"),
+    }
+
+    if len(_COMPLETED_RESULTS) >= _COMPLETED_RESULTS_MAX:
+        _COMPLETED_RESULTS.pop(next(iter(_COMPLETED_RESULTS)))
+    _COMPLETED_RESULTS[job_id] = result
+    return result
 
 
 @app.function(image=backend_image, timeout=120)
 @fastapi_endpoint(method="GET")
-def fetch_result(job_id: str):
+async def fetch_result(job_id: str):
     """
     GET /fetch_result?job_id=...
 
@@ -24,28 +55,15 @@ def fetch_result(job_id: str):
 
     If not complete, returns current status + message.
     """
-    if job_id not in JOB_STORE:
+    status = await get_job_status(job_id)
+    if status is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    job = JOB_STORE[job_id]
-    status = job.get("status")
-
     if status != "complete":
         return {
-            "job_id": job.get("job_id"),
+            "job_id": job_id,
             "status": status,
             "message": "Job not complete yet",
         }
 
-    return {
-        "job_id": job.get("job_id"),
-        "status": "complete",
-        "genre": job.get("genre"),
-        "mood": job.get("mood"),
-        "captions": job.get("captions"),
-        "summary": job.get("summary"),
-        "lyrics": job.get("lyrics"),
-        "audio_path": job.get("audio_url") or job.get("audio_path"),
-        "audio_url": job.get("audio_url") or job.get("audio_path"),
-        "audio_filename": job.get("audio_filename"),
-    }
+    return await _completed_result(job_id)
@@ -12,13 +12,14 @@ from modal_app import app, backend_image, JOB_STORE
 
 @app.function(image=backend_image, timeout=120)
 @fastapi_endpoint(method="GET")
-def get_status(job_id: str):
+async def get_status(job_id: str):
     """
     GET /get_status?job_id=...
 
     Returns the full job object, including status.
     """
-    if job_id not in JOB_STORE:
+    job = await JOB_STORE.get.aio(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return JOB_STORE[job_id]
\ No newline at end of file
+    return job
\ No newline at end of file
@@ -0,0 +1,69 @@
+# backend/api/stream_status.py
+
+import asyncio
+import json
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from modal import fastapi_endpoint
+
+from modal_app import app, backend_image, JOB_STORE
+
+POLL_INTERVAL_S = 0.5
+TERMINAL_STATUSES = {"complete", "failed"}
+# SSE comment sent after this long without an event, so proxies keep the
+# connection open
+HEARTBEAT_INTERVAL_S = 15.0
+# Close the stream if a job sits in "created" (never submitted) this long
+CREATED_IDLE_LIMIT_S = 300.0
+
+
+@app.function(image=backend_image, timeout=1200)
+@fastapi_endpoint(method="GET")
+async def stream_status(job_id: str):
+    """
+    GET /stream_status?job_id=...
+
+    Server-Sent Events stream of the job object. Emits one `data:` event
+    per pipeline transition (tracked by the job's `step` counter) and
+    closes once the job is complete or failed, or if it is never
+    submitted within CREATED_IDLE_LIMIT_S.
+    """
+    if not await JOB_STORE.contains.aio(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        last_step = None
+        last_event_at = opened_at = loop.time()
+        while True:
+            job = await JOB_STORE.get.aio(job_id)
+            if job is None:
+                return
+
+            now = loop.time()
+            step = job.get("step", 0)
+            if step != last_step:
+                last_step = step
+                last_event_at = now
+                yield f"data: {json.dumps(job)}\n\n"
+            elif now - last_event_at >= HEARTBEAT_INTERVAL_S:
+                last_event_at = now
+                yield ": heartbeat\n\n"
+
+            status = job.get("status")
+            if status in TERMINAL_STATUSES:
+                return
+            if status == "created" and now - opened_at >= CREATED_IDLE_LIMIT_S:
+                return
+
+            await asyncio.sleep(POLL_INTERVAL_S)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -2,38 +2,70 @@
 
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from pydantic import BaseModel, Field
 from fastapi import HTTPException
 
-from modal import fastapi_endpoint
-from modal_app import app, backend_image, GPU_TYPE, JOB_STORE, PHOTOS_VOLUME, AUDIO_VOLUME
+from modal import enter, fastapi_endpoint, method
+from modal_app import (
+    app, backend_image, GPU_TYPE, PIPELINE_MAX_CONTAINERS, JOB_STORE,
+    PHOTOS_VOLUME, AUDIO_VOLUME, publish_job, publish_job_aio,
+)
 
-from workers.image_analysis_worker import generate_photo_captions
+from workers.image_analysis_worker import generate_photo_captions, _ensure_blip
 from workers.summary_worker import summarize_captions
 from workers.lyrics_worker import generate_lyrics
-from workers.vocal_worker import generate_vocals
+from workers.vocal_worker import generate_vocals, wait_for_vocals, _ensure_bark_pipeline
 from workers.music_worker import generate_music
 from workers.packaging_worker import package_result
 
 
+# Background threads for work that can overlap the sequential pipeline
+# stages (model loading while captions / LLM calls run)
+_STAGE_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pipeline-stage")
+
+
 class SubmitJobRequest(BaseModel):
     job_id: str = Field(..., description="Job ID from /upload_photo")
     genre: str = Field(..., description="e.g., pop, rock, edm, lo-fi")
     mood: str = Field(..., description="e.g., nostalgic, happy, epic")
 
 
+def _publish(job_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    """Store the job state, bumping `step` so /stream_status sees a change."""
+    return publish_job(job_id, state)
+
+
 # GPU pipeline worker – internal, not HTTP-exposed
-@app.function(
+@app.cls(
     image=backend_image,
     gpu=GPU_TYPE,
     timeout=1200,
     volumes={
         "/photos": PHOTOS_VOLUME,
         "/audio": AUDIO_VOLUME
-    }
+    },
+    min_containers=1,  # Keep one GPU container warm for the first user
+    # One input per container (no @modal.concurrent); scale out instead
+    max_containers=PIPELINE_MAX_CONTAINERS,
 )
+class Pipeline:
+    @enter()
+    def load_models(self):
+        """Load BLIP-2 and Bark once per container, before any job runs."""
+        # Load both concurrently so weight reads / compilation overlap
+        bark_loaded = _STAGE_POOL.submit(_ensure_bark_pipeline)
+        _ensure_blip("cuda")
+        bark_loaded.result()
+
+    @method()
+    def run(self, job_id: str):
+        _run_pipeline(job_id)
+
+
 def _run_pipeline(job_id: str):
     """
     Internal worker: runs the full pipeline for a given job_id.
@@ -46,10 +78,11 @@ def _run_pipeline(job_id: str):
       5. Vocals via Bark TTS (singing/speech)
       6. Package + update JOB_STORE
     """
-    if job_id not in JOB_STORE:
+    job = JOB_STORE.get(job_id)
+    if job is None:
         raise RuntimeError(f"Job {job_id} not found")
 
-    job = dict(JOB_STORE[job_id])  # copy
+    job = dict(job)  # copy
     image_urls = job.get("image_urls", [])
     image_paths = job.get("image_paths", [])
     genre = job.get("genre", "pop")
@@ -59,39 +92,46 @@ def _run_pipeline(job_id: str):
     image_sources = image_urls + image_paths
 
     if not image_sources:
-        JOB_STORE[job_id] = {
+        _publish(job_id, {
             "job_id": job_id,
             "status": "failed",
             "error": "No image sources (URLs or paths) stored on job",
-        }
+            "step": job.get("step", 0),
+        })
         return
 
-    # Update status
-    JOB_STORE[job_id] = {**job, "status": "processing"}
+    # Vocals need the lyrics, which need the summary, so the stages run in
+    # order; only Bark's loading (a no-op once the container is warm) runs
+    # in the background alongside captions and the LLM calls
+    bark_loaded = _STAGE_POOL.submit(_ensure_bark_pipeline)
 
     try:
         # 1) Captions
+        job = _publish(job_id, {**job, "status": "processing", "stage": "captions"})
         captions = generate_photo_captions(image_sources, device="cuda")
 
         # 2) Summary
+        job = _publish(job_id, {**job, "stage": "summary"})
         summary = summarize_captions(captions)
 
         # 3) Lyrics
+        job = _publish(job_id, {**job, "stage": "lyrics"})
         lyrics = generate_lyrics(summary, genre=genre, mood=mood)
 
-        # Ensure we have a persistent directory for generated audio
+        # Persistent directory for generated audio (created by generate_vocals)
         audio_dir = "/audio"
-        os.makedirs(audio_dir, exist_ok=True)
 
-        # 4) Vocals from lyrics (Bark)
+        # 4) Vocals from lyrics (Bark); the WAV is written in the background
+        job = _publish(job_id, {**job, "stage": "vocals"})
+        bark_loaded.result()
         audio_path = generate_vocals(
             job_id=job_id,
             lyrics=lyrics,
             out_dir=audio_dir,
         )
-        AUDIO_VOLUME.commit()
 
-        # 5) Package result
+        # 5) Package result while the WAV is encoded, then persist the file
+        #    before the job is marked complete
         result = package_result(
             job_id=job_id,
             captions=captions,
@@ -99,21 +139,24 @@ def _run_pipeline(job_id: str):
             lyrics=lyrics,
             audio_path=audio_path,
         )
+        wait_for_vocals(audio_path)
+        AUDIO_VOLUME.commit()
 
-        JOB_STORE[job_id] = result
+        _publish(job_id, {**result, "step": job["step"]})
 
     except Exception as e:
-        JOB_STORE[job_id] = {
+        _publish(job_id, {
             "job_id": job_id,
             "status": "failed",
             "error": str(e),
-        }
+            "step": job.get("step", 0),
+        })
         raise
 
 
 @app.function(image=backend_image, timeout=300)
 @fastapi_endpoint(method="POST")
-def submit_job(body: SubmitJobRequest):
+async def submit_job(body: SubmitJobRequest):
     """
     POST /submit_job
 
@@ -125,10 +168,11 @@ def submit_job(body: SubmitJobRequest):
     """
     job_id = body.job_id
 
-    if job_id not in JOB_STORE:
+    job = await JOB_STORE.get.aio(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    job = dict(JOB_STORE[job_id])
+    job = dict(job)
 
     if job.get("status") not in ("created", "failed"):
         raise HTTPException(
@@ -148,9 +192,10 @@ def submit_job(body: SubmitJobRequest):
     job["genre"] = body.genre
     job["mood"] = body.mood
     job["status"] = "queued"
-    JOB_STORE[job_id] = job
+    await publish_job_aio(job_id, job)
 
-    # Spawn GPU pipeline
-    _run_pipeline.spawn(job_id)
+    # Spawn GPU pipeline (status is already "queued" while it waits for a
+    # free container)
+    await Pipeline().run.spawn.aio(job_id)
 
     return {"job_id": job_id, "status": "queued"}
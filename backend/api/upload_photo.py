@@ -1,9 +1,13 @@
 # backend/api/upload_photo.py
 
 from typing import List, Optional
+import asyncio
+import hashlib
 import uuid
 import os
 
+import anyio
+import magic
 from pydantic import BaseModel, Field
 from fastapi import HTTPException, UploadFile, File, Form
 from fastapi.responses import JSONResponse
@@ -13,7 +17,9 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from modal import fastapi_endpoint
-from modal_app import app, backend_image, JOB_STORE, PHOTOS_VOLUME
+from modal_app import app, backend_image, save_job, save_job_aio, PHOTOS_VOLUME
+
+UPLOAD_CHUNK_BYTES = 1 << 20
 
 
 class UploadPhotoRequest(BaseModel):
@@ -25,7 +31,7 @@ class UploadPhotoRequest(BaseModel):
 # Endpoint for URL-based uploads (backward compatible)
 @app.function(image=backend_image, timeout=300)
 @fastapi_endpoint(method="POST")
-def upload_photo(body: UploadPhotoRequest):
+async def upload_photo(body: UploadPhotoRequest):
     """
     POST /upload_photo
 
@@ -45,17 +51,52 @@ def upload_photo(body: UploadPhotoRequest):
 
     job_id = str(uuid.uuid4())
 
-    JOB_STORE[job_id] = {
+    await save_job_aio(job_id, {
         "job_id": job_id,
         "status": "created",
         "image_urls": body.image_urls,
         "image_paths": [],  # Empty for URL-based uploads
         # genre / mood filled at /submit_job
-    }
+    })
 
     return {"job_id": job_id, "status": "created"}
 
 
+async def _save_upload(file: UploadFile, tmp_path: str, ext: str) -> Optional[str]:
+    """
+    Stream one upload to disk chunk by chunk. The first chunk is sniffed
+    with libmagic; non-image payloads are rejected before anything is
+    written.
+
+    The file is stored under a SHA-256 content-hash name, so identical
+    photos in one upload share a single file (and a single caption).
+    Returns the saved path, or None if the upload was rejected.
+    """
+    chunk = await file.read(UPLOAD_CHUNK_BYTES)
+    if not magic.from_buffer(chunk, mime=True).startswith("image/"):
+        return None
+
+    digest = hashlib.sha256()
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as out:
+            while chunk:
+                digest.update(chunk)
+                await out.write(chunk)
+                chunk = await file.read(UPLOAD_CHUNK_BYTES)
+
+        file_path = os.path.join(
+            os.path.dirname(tmp_path), f"{digest.hexdigest()[:16]}{ext}"
+        )
+        if not os.path.exists(file_path):
+            os.replace(tmp_path, file_path)
+    finally:
+        # Duplicate content, or a failed read / write: drop the partial file
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return file_path
+
+
 # New endpoint for file uploads
 @app.function(
     image=backend_image,
@@ -84,27 +125,18 @@ async def upload_photo_files(files: List[UploadFile] = File(...)):
     job_dir = f"/photos/{job_id}"
     os.makedirs(job_dir, exist_ok=True)
 
-    image_paths = []
-    uploaded_count = 0
-
-    for idx, file in enumerate(files):
-        # Validate file type
-        content_type = file.content_type or ""
-        if not content_type.startswith("image/"):
-            continue
-
-        # Generate safe filename
-        ext = os.path.splitext(file.filename)[1] or ".jpg"
-        safe_filename = f"photo_{idx}{ext}"
-        file_path = os.path.join(job_dir, safe_filename)
-
-        # Save file to volume
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-
-        image_paths.append(file_path)
-        uploaded_count += 1
+    # Save files to volume concurrently; each is renamed to its content
+    # hash once fully written
+    saved = await asyncio.gather(*(
+        _save_upload(
+            file,
+            os.path.join(job_dir, f"photo_{idx}.part"),
+            os.path.splitext(file.filename)[1] or ".jpg",
+        )
+        for idx, file in enumerate(files)
+    ))
+    image_paths = [path for path in saved if path is not None]
+    uploaded_count = len(image_paths)
 
     # Commit the volume so files persist
     PHOTOS_VOLUME.commit()
@@ -115,13 +147,13 @@ async def upload_photo_files(files: List[UploadFile] = File(...)):
             detail="No valid image files found. Please upload image files."
         )
 
-    JOB_STORE[job_id] = {
+    save_job(job_id, {
         "job_id": job_id,
         "status": "created",
         "image_urls": [],  # Empty for file-based uploads
         "image_paths": image_paths,
         # genre / mood filled at /submit_job
-    }
+    })
 
     return {
         "job_id": job_id,
@@ -1,6 +1,8 @@
 # backend/modal_app.py
 
 import os
+from typing import Any, Dict, Optional
+
 import modal
 
 app = modal.App("family-photo-song-backend")
@@ -10,6 +12,51 @@ JOB_STORE = modal.Dict.from_name(
     "family-photo-song-jobs", create_if_missing=True
 )
 
+
+def _status_key(job_id: str) -> str:
+    return f"{job_id}:status"
+
+
+def save_job(job_id: str, job: Dict[str, Any]) -> None:
+    """
+    Store a job and mirror its status under "<job_id>:status" in a single
+    round trip, so status checks don't need to pull the full job blob.
+    """
+    JOB_STORE.update({job_id: job, _status_key(job_id): job.get("status")})
+
+
+async def save_job_aio(job_id: str, job: Dict[str, Any]) -> None:
+    """Async variant of save_job for `async def` endpoints."""
+    await JOB_STORE.update.aio({job_id: job, _status_key(job_id): job.get("status")})
+
+
+def publish_job(job_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store a status transition: bumps the job's `step` counter (which
+    /stream_status watches) and saves it. Returns the updated job.
+    """
+    job["step"] = job.get("step", 0) + 1
+    save_job(job_id, job)
+    return job
+
+
+async def publish_job_aio(job_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of publish_job for `async def` endpoints."""
+    job["step"] = job.get("step", 0) + 1
+    await save_job_aio(job_id, job)
+    return job
+
+
+async def get_job_status(job_id: str) -> Optional[str]:
+    """Return just the job's status, or None if the job doesn't exist."""
+    status = await JOB_STORE.get.aio(_status_key(job_id))
+    if status is None:
+        # Jobs written before the status key existed
+        job = await JOB_STORE.get.aio(job_id)
+        status = job.get("status") if job is not None else None
+    return status
+
+
 # Volume to store uploaded photos
 PHOTOS_VOLUME = modal.Volume.from_name(
     "family-photo-uploads", create_if_missing=True
@@ -25,12 +72,15 @@ AUDIO_VOLUME = modal.Volume.from_name(
 # - torch==2.3.1: Newer PyTorch with _pytree.register_pytree_node API
 # - numpy<2: Avoid NumPy 2.x compatibility issues with compiled modules
 # - transformers==4.45.2 & diffusers==0.31.0: Compatible with torch 2.3.1
+# - starlette>=0.39.0: FileResponse serves Range requests (audio seeking)
 backend_image = (
     modal.Image.debian_slim()
+    .apt_install("libmagic1")  # python-magic upload sniffing
     .pip_install(
         # Core ML stack
         "torch==2.3.1",
         "accelerate==0.33.0",
+        "bitsandbytes",  # int8 BLIP-2 weights
         "transformers==4.45.2",
         "sentencepiece",
         "safetensors",
@@ -40,12 +90,17 @@ backend_image = (
         "numpy<2",
         "scipy",
         "soundfile",
+        # Caching
+        "diskcache",
         # Vision / HTTP
         "requests",
+        "orjson",  # Fast JSON for LLM request / stream bodies
         "Pillow",
         # Web framework
         "fastapi",
+        "starlette>=0.39.0",  # FileResponse with HTTP Range support
         "python-multipart",
+        "python-magic",
         "pydantic",
     )
     .env({
@@ -55,7 +110,18 @@ backend_image = (
         # Model selection (can override for better quality)
         "BLIP_MODEL": "Salesforce/blip2-flan-t5-xl",  # Best captions
         "BARK_MODEL_ID": "suno/bark",  # Better audio quality
+        # Weights baked in by models/download_weights.py (kept outside
+        # /root, where the backend source is added)
+        "HF_HOME": "/models/huggingface",
     })
+    # Standalone script, so the build step doesn't import api/ or workers/
+    # before the source layer below exists
+    .add_local_file(
+        os.path.join(os.path.dirname(__file__), "models", "download_weights.py"),
+        remote_path="/build/download_weights.py",
+        copy=True,
+    )
+    .run_commands("python /build/download_weights.py")
     .add_local_dir(
         os.path.dirname(__file__),
         remote_path="/root",
@@ -65,6 +131,11 @@ backend_image = (
 # Choose your GPU type depending on Modal plan
 GPU_TYPE = "A10G"  # e.g. "A100-40GB", "H100"
 
+# Cap on concurrently running pipeline GPU containers. Each container runs
+# one job at a time (BLIP-2 + Bark fill most of a 24 GB card), so bursts
+# queue up instead of thrashing VRAM.
+PIPELINE_MAX_CONTAINERS = int(os.environ.get("PIPELINE_MAX_CONTAINERS", "4"))
+
 # ---- Optional local test entrypoint ----
 
 
@@ -79,7 +150,7 @@ def main():
     from workers.image_analysis_worker import generate_photo_captions
     from workers.summary_worker import summarize_captions
     from workers.lyrics_worker import generate_lyrics
-    from workers.vocal_worker import generate_vocals
+    from workers.vocal_worker import generate_vocals, wait_for_vocals
     from workers.packaging_worker import package_result
 
     import uuid
@@ -98,9 +169,10 @@ def main():
         job_id=test_job_id,
         lyrics=lyrics,
     )
+    wait_for_vocals(audio_path)
     result = package_result(test_job_id, captions, summary, lyrics, audio_path)
     print(result)
 
 
 # Ensure API endpoints are imported so Modal sees them on deploy
-from api import upload_photo, submit_job, get_status, fetch_result, download_audio  # noqa: F401
+from api import upload_photo, submit_job, get_status, fetch_result, download_audio, stream_status  # noqa: F401
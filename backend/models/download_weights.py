@@ -0,0 +1,37 @@
+# backend/models/download_weights.py
+#
+# Image build step: pull the BLIP-2 and Bark checkpoints into HF_HOME so
+# cold containers read weights from local disk instead of the Hub.
+# Runs before the backend source is added to the image, so it must only
+# depend on huggingface_hub (no api/ or workers/ imports).
+
+import os
+
+from huggingface_hub import list_repo_files, snapshot_download
+
+# Configs, tokenizer files (vocab.txt, spiece.model) and Bark's speaker
+# presets; everything from_pretrained / the voice preset loader reads
+# besides the weights themselves
+_SUPPORT_PATTERNS = ["*.json", "*.txt", "*.model", "speaker_embeddings/**"]
+
+
+def _weight_patterns(repo_id: str) -> list:
+    """
+    One weight format per repo: transformers prefers safetensors when both
+    are published, and suno/bark's original .pt checkpoints are never read.
+    """
+    files = list_repo_files(repo_id)
+    if any(name.endswith(".safetensors") for name in files):
+        return ["*.safetensors"]
+    return ["pytorch_model*.bin"]
+
+
+def download_weights() -> None:
+    for repo_id in (os.environ["BLIP_MODEL"], os.environ["BARK_MODEL_ID"]):
+        snapshot_download(
+            repo_id, allow_patterns=_SUPPORT_PATTERNS + _weight_patterns(repo_id)
+        )
+
+
+if __name__ == "__main__":
+    download_weights()
@@ -5,5 +5,5 @@ from .image_analysis_worker import generate_photo_captions  # noqa: F401
 from .summary_worker import summarize_captions              # noqa: F401
 from .lyrics_worker import generate_lyrics                  # noqa: F401
 from .music_worker import generate_music                    # noqa: F401
-from .vocal_worker import generate_vocals                   # noqa: F401
+from .vocal_worker import generate_vocals, wait_for_vocals  # noqa: F401
 from .packaging_worker import package_result                # noqa: F401
\ No newline at end of file
@@ -1,12 +1,16 @@
 # backend/workers/lyrics_worker.py
 
 import re
+import string
 from typing import List
 
-from .summary_worker import _call_llmstudio
+from .summary_worker import _call_llmstudio, _has_disallowed_chars
 
-_NON_ASCII_RE = re.compile(r"[^\x09\x0A\x0D\x20-\x7E]")
-_STOPWORDS = {
+# Punctuation (except apostrophes/hyphens inside words) and digits split tokens
+_KEYWORD_SEPARATORS = str.maketrans(
+    {c: " " for c in string.punctuation.replace("'", "").replace("-", "") + string.digits}
+)
+_STOPWORDS = frozenset({
     "the",
     "and",
     "with",
@@ -39,7 +43,7 @@ _STOPWORDS = {
     "just",
     "like",
     "through",
-}
+})
 
 
 def _looks_like_valid_lyrics(text: str) -> bool:
@@ -49,7 +53,7 @@ def _looks_like_valid_lyrics(text: str) -> bool:
     if "[Verse" not in text or "[Chorus]" not in text:
         return False
 
-    if _NON_ASCII_RE.search(text):
+    if _has_disallowed_chars(text):
         return False
 
     words = text.split()
@@ -60,9 +64,9 @@ def _looks_like_valid_lyrics(text: str) -> bool:
 
 
 def _extract_keywords(summary: str, limit: int = 12) -> List[str]:
-    tokens = re.findall(r"[A-Za-z][A-Za-z'-]*", summary)
     keywords = []
-    for token in tokens:
+    for token in summary.translate(_KEYWORD_SEPARATORS).split():
+        token = token.lstrip("'-")
         lowered = token.lower()
         if len(token) < 3 or lowered in _STOPWORDS:
             continue
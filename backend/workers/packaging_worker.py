@@ -1,8 +1,32 @@
 # backend/workers/packaging_worker.py
 
 import os
-from typing import List, Dict, Any
-from urllib.parse import quote_plus
+from functools import lru_cache
+from types import MappingProxyType
+from typing import List, Dict, Any, Mapping
+from urllib.parse import quote
+
+_BASE_URL_DEFAULT = "https://sahaarkajyoti2018--family-photo-song-backend-download-audio.modal.run"
+
+
+@lru_cache(maxsize=256)
+def _audio_fields(job_id: str, audio_path: str, base_url: str) -> Mapping[str, Any]:
+    """
+    The audio/URL part of the payload depends only on these three values,
+    so it is built once per job and reused on retries (read-only view).
+    """
+    # Full URL that the browser can access
+    public_url = f"{base_url}?job_id={quote(job_id, safe='')}"
+
+    return MappingProxyType({
+        "job_id": job_id,
+        "status": "complete",
+        # Return full Modal URL for browser access
+        "audio_url": public_url,
+        "audio_path": public_url,  # Keep for backward compatibility
+        "audio_filename": os.path.basename(audio_path),
+        "_audio_file_path": audio_path,  # Internal use only
+    })
 
 
 def package_result(
@@ -11,26 +35,16 @@ def package_result(
     summary: str,
     lyrics: str,
     audio_path: str,
-    base_url: str = "https://sahaarkajyoti2018--family-photo-song-backend-download-audio.modal.run"
+    base_url: str = _BASE_URL_DEFAULT,
 ) -> Dict[str, Any]:
     """
     Prepare the result object stored in JOB_STORE.
 
     Returns a publicly accessible URL for the audio file.
     """
-    audio_filename = os.path.basename(audio_path)
-    # Full URL that the browser can access
-    public_url = f"{base_url}?job_id={quote_plus(job_id)}"
-
     return {
-        "job_id": job_id,
-        "status": "complete",
+        **_audio_fields(job_id, audio_path, base_url),
         "captions": captions,
         "summary": summary,
         "lyrics": lyrics,
-        # Return full Modal URL for browser access
-        "audio_url": public_url,
-        "audio_path": public_url,  # Keep for backward compatibility
-        "audio_filename": audio_filename,
-        "_audio_file_path": audio_path,  # Internal use only
     }
@@ -1,9 +1,34 @@
 # backend/workers/summary_worker.py
 
-from typing import List
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
 import os
-import requests
 import re
+import string
+import orjson
+import requests
+from diskcache import Cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Pooled keep-alive session for LLM calls, so repeated calls skip the
+# TCP/TLS handshake to the (ngrok) endpoint. Sessions are safe to share
+# across threads for plain POSTs like these.
+_LLM_SESSION = requests.Session()
+_llm_adapter = HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"POST"}),  # Retry skips POST by default
+    ),
+)
+_LLM_SESSION.mount("http://", _llm_adapter)
+_LLM_SESSION.mount("https://", _llm_adapter)
 
 
 def _call_llmstudio(
@@ -11,10 +36,15 @@ def _call_llmstudio(
     user_prompt: str,
     max_new_tokens: int = 512,
     temperature: float = 0.7,
+    max_sentences: Optional[int] = None,
 ) -> str:
     """
     Call a local LLMStudio / LM Studio server via an OpenAI-compatible HTTP API.
 
+    The response is streamed. With max_sentences set, the stream is closed
+    once that many complete sentences have arrived (so the server stops
+    decoding) and the text is cut after the last of them.
+
     Because this backend runs on Modal in the cloud, your local LLMStudio
     must be reachable via a public URL (for example using ngrok or Cloudflare
     tunnel). Set:
@@ -42,7 +72,7 @@ def _call_llmstudio(
         ],
         "temperature": temperature,
         "max_tokens": max_new_tokens,
-        "stream": False,
+        "stream": True,
     }
 
     headers = {"Content-Type": "application/json"}
@@ -51,28 +81,83 @@ def _call_llmstudio(
         headers["Authorization"] = f"Bearer {api_key}"
 
     try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=120)
-        resp.raise_for_status()
-        data = resp.json()
-        return data["choices"][0]["message"]["content"].strip()
+        # (connect, read) timeouts
+        # orjson serializes straight to bytes (stdlib json builds a str first)
+        with _LLM_SESSION.post(
+            url, data=orjson.dumps(payload), headers=headers, stream=True, timeout=(5, 120)
+        ) as resp:
+            resp.raise_for_status()
+            return _read_stream(resp, max_sentences)
     except requests.exceptions.RequestException as e:
         # Fallback if LLMStudio is not available
         print(f"Warning: LLMStudio not accessible ({e}). Using fallback response.")
         return f"Generated response for: {user_prompt[:100]}..."
 
 
-_NON_ASCII_RE = re.compile(r"[^\x09\x0A\x0D\x20-\x7E]")
+# A sentence ends at terminal punctuation followed by whitespace (so the
+# model has moved on), unless it closes a common title abbreviation
+_SENTENCE_END_RE = re.compile(
+    r"(?<!\bMr)(?<!\bMrs)(?<!\bMs)(?<!\bDr)(?<!\bSt)(?<!\bJr)(?<!\bSr)[.!?]+(?=\s)"
+)
+
+
+def _read_stream(resp: requests.Response, max_sentences: Optional[int]) -> str:
+    """Accumulate content deltas from an OpenAI-style SSE stream."""
+    text = ""
+    sentences = 0
+    scan_from = 0  # Everything before this has been checked for sentence ends
+    for line in resp.iter_lines():
+        if not line.startswith(b"data:"):
+            continue
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            break
+
+        delta = orjson.loads(data)["choices"][0].get("delta", {})
+        content = delta.get("content")
+        if not content:
+            continue
+        text += content
+
+        if max_sentences is None:
+            continue
+        for match in _SENTENCE_END_RE.finditer(text, scan_from):
+            sentences += 1
+            scan_from = match.end()
+            if sentences >= max_sentences:
+                # Leaving the with-block closes the connection
+                return text[:scan_from].strip()
+    return text.strip()
+
+
+# Bytes allowed in LLM output: tab, LF, CR and printable ASCII. Deleting
+# them with bytes.translate leaves only the disallowed bytes, in one C pass.
+_ALLOWED_BYTES = bytes(b for b in range(256) if 0x20 <= b <= 0x7E or b in (0x09, 0x0A, 0x0D))
+
+
+def _has_disallowed_chars(text: str) -> bool:
+    # str.isascii reads a flag on the string object, so non-ASCII text is
+    # rejected without scanning; ASCII text only needs the control-char check
+    if not text.isascii():
+        return True
+    return bool(text.encode("ascii").translate(None, _ALLOWED_BYTES))
+
+
+# Deletes ASCII letters; the length difference is the letter count. Only
+# applied after _has_disallowed_chars, so ASCII letters are all letters.
+_NON_ALPHA_TRANS = str.maketrans("", "", string.ascii_letters)
 
 
 def _looks_like_valid_summary(text: str) -> bool:
     if not text:
         return False
 
-    alpha_ratio = sum(ch.isalpha() for ch in text) / max(len(text), 1)
-    if alpha_ratio < 0.4:
+    if _has_disallowed_chars(text):
         return False
 
-    if _NON_ASCII_RE.search(text):
+    alpha_count = len(text) - len(text.translate(_NON_ALPHA_TRANS))
+    alpha_ratio = alpha_count / max(len(text), 1)
+    if alpha_ratio < 0.4:
         return False
 
     if len(text.split()) < 8:
@@ -102,11 +187,69 @@ def _fallback_summary(captions: List[str]) -> str:
     return summary
 
 
+# Two-tier cache of LLM summaries keyed by the caption set: an in-process
+# dict in front of an on-disk cache that survives across jobs on the same
+# container. Only validated LLM output with the requested 2+ sentences is
+# stored, never fallback text. Bump the version to orphan old entries
+# (v1 held one-sentence summaries cut short by an early stream stop).
+_SUMMARY_CACHE_VERSION = 2
+_SUMMARY_CACHE_MAX = 512
+_SUMMARY_CACHE_TTL_S = 7 * 24 * 3600
+_SUMMARY_MIN_CACHED_SENTENCES = 2
+_summary_memory: Dict[str, str] = {}
+
+
+@lru_cache(maxsize=1)
+def _summary_disk() -> Cache:
+    # Opened on first use, so processes that only import the workers
+    # package (web endpoints, `modal deploy`) never create the SQLite store
+    return Cache("/tmp/summary_cache")
+
+
+@lru_cache(maxsize=_SUMMARY_CACHE_MAX)
+def _summary_key(captions: Tuple[str, ...]) -> str:
+    payload = json.dumps([_SUMMARY_CACHE_VERSION, sorted(captions)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _get_cached_summary(key: str) -> Optional[str]:
+    summary = _summary_memory.get(key)
+    if summary is None:
+        summary = _summary_disk().get(key)
+        if summary is not None:
+            _remember_summary(key, summary)
+    return summary
+
+
+def _remember_summary(key: str, summary: str) -> None:
+    if len(_summary_memory) >= _SUMMARY_CACHE_MAX:
+        _summary_memory.pop(next(iter(_summary_memory)))
+    _summary_memory[key] = summary
+
+
+def _cache_summary(key: str, summary: str) -> None:
+    # The final sentence has no trailing whitespace, so pad it for the regex
+    if len(_SENTENCE_END_RE.findall(summary + " ")) < _SUMMARY_MIN_CACHED_SENTENCES:
+        return
+    _remember_summary(key, summary)
+    _summary_disk().set(key, summary, expire=_SUMMARY_CACHE_TTL_S)
+
+
+# The prompt asks for 2-3 sentences; anything past the third is cut off
+_SUMMARY_MAX_SENTENCES = 3
+
+
 def summarize_captions(captions: List[str]) -> str:
     """
     Given a list of image captions, produce a single narrative summary
-    using your local LLMStudio model.
+    using your local LLMStudio model. Summaries for a caption set seen
+    before are served from cache.
     """
+    cache_key = _summary_key(tuple(captions))
+    cached = _get_cached_summary(cache_key)
+    if cached is not None:
+        return cached
+
     captions_text = "\n".join(f"- {c}" for c in captions)
     
     # Try using LLMStudio, fallback to simple summary if unavailable
@@ -131,10 +274,12 @@ people, and feelings. Make it personal and evocative.
             user_prompt=user_prompt,
             max_new_tokens=256,
             temperature=0.7,
+            max_sentences=_SUMMARY_MAX_SENTENCES,
         )
         if not _looks_like_valid_summary(summary):
             raise ValueError("LLM returned a low-quality summary")
 
+        _cache_summary(cache_key, summary)
         return summary
     except Exception as e:
         print(f"LLMStudio unavailable, using fallback summary: {e}")
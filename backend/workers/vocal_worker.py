@@ -1,7 +1,11 @@
 # backend/workers/vocal_worker.py
 
 import os
-from typing import Dict, Optional
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import soundfile as sf
@@ -13,11 +17,54 @@ from transformers import AutoProcessor, BarkModel
 # - "suno/bark" - Better quality, 2GB, slower but more natural
 # For production/demos, upgrade to full "suno/bark" for best results
 BARK_MODEL_ID = os.environ.get("BARK_MODEL_ID", "suno/bark")
+# Speaker prompt; v2/en_speaker_6 is a clear English voice
+BARK_VOICE_PRESET = os.environ.get("BARK_VOICE_PRESET", "v2/en_speaker_6")
+# Opt-in weight quantization for CPU-only containers: "int8", "int4" or
+# "off" (default, full-quality fp32). GPU runs keep fp16 weights.
+BARK_QUANTIZE = os.environ.get("BARK_QUANTIZE", "off").lower()
+# Opt-in: set to 1 to replay the fine acoustic stage (the only Bark stage
+# with a fixed window length) as CUDA Graphs
+BARK_CUDA_GRAPHS = os.environ.get("BARK_CUDA_GRAPHS", "0") == "1"
 
 _bark_model: Optional[BarkModel] = None
 _bark_processor: Optional[AutoProcessor] = None
 _bark_device: Optional[torch.device] = None
 _bark_sampling_rate: Optional[int] = None
+_bark_voice_preset: Optional[Dict[str, torch.Tensor]] = None
+# Set only once every global above is populated; loads are serialized by
+# the lock so Bark can be warmed from a background thread
+_bark_ready = False
+_bark_lock = threading.Lock()
+
+# Section headers the LLM (or fallback) puts in lyrics; Bark would read them aloud
+_SECTION_RE = re.compile(
+    r"\[(?:Verse\s*\d*|Chorus|Bridge|Pre-?Chorus|Outro|Intro)\]", re.IGNORECASE
+)
+
+# Bark speaks clearly up to ~200 characters per prompt; longer lyrics are
+# split into chunks that are generated together as one batch
+_MAX_CHUNK_CHARS = 200
+_MAX_CHUNKS = 8  # Batch size cap to stay within VRAM
+# Semantic tokens allowed per prompt character. Bounds generation for short
+# prompts instead of running to the 768-token default when EOS is missed.
+_SEMANTIC_TOKENS_PER_CHAR = 3.5
+# Bark's semantic pad / EOS token
+_BARK_PAD_TOKEN_ID = 10_000
+
+# WAV encoding runs in the background so generate_vocals returns as soon as
+# the audio is on the host; callers wait with wait_for_vocals() before the
+# file is needed. Pending writes are keyed by output path.
+_WRITER_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="wav-writer")
+_pending_writes: Dict[str, Future] = {}
+
+# 2s 440 Hz tone written when Bark returns silence, built once at Bark's
+# native 24kHz, already at the 0.95 output peak and in (T, 1) float32 shape.
+# Read-only, so it can be handed to the writer thread without a copy.
+_FALLBACK_TONE_SR = 24_000
+_FALLBACK_TONE = (
+    0.95 * np.sin(2 * np.pi * 440 * np.arange(2 * _FALLBACK_TONE_SR) / _FALLBACK_TONE_SR)
+).astype(np.float32)[:, None]
+_FALLBACK_TONE.flags.writeable = False
 
 
 def _ensure_bark_pipeline():
@@ -25,20 +72,178 @@ def _ensure_bark_pipeline():
     Lazy-load Bark model + processor.
     Bark is a transformer-based text-to-audio model by Suno that can generate speech,
     music-like audio, and simple singing, and its checkpoints are MIT-licensed.
+    Safe to call from several threads; the model is loaded once.
     """
-    global _bark_model, _bark_processor, _bark_device, _bark_sampling_rate
-
-    if _bark_model is not None and _bark_processor is not None:
+    if _bark_ready:
         return
 
+    with _bark_lock:
+        if not _bark_ready:
+            _load_bark_pipeline()
+
+
+def _load_bark_pipeline():
+    global _bark_model, _bark_processor, _bark_device, _bark_sampling_rate, _bark_voice_preset
+    global _bark_ready
+
     _bark_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    use_cuda = _bark_device.type == "cuda"
+
+    if use_cuda:
+        # Let cuDNN autotune the Encodec decoder convolutions, and allow TF32
+        # for any matmuls that still run in fp32
+        torch.backends.cudnn.benchmark = True
+        torch.backends.cuda.matmul.allow_tf32 = True
 
     _bark_processor = AutoProcessor.from_pretrained(BARK_MODEL_ID)
-    _bark_model = BarkModel.from_pretrained(BARK_MODEL_ID)
+    _bark_model = BarkModel.from_pretrained(
+        BARK_MODEL_ID,
+        torch_dtype=torch.float16 if use_cuda else torch.float32,
+    )
     _bark_model = _bark_model.to(_bark_device)
     _bark_model.eval()
 
+    if not use_cuda:
+        _bark_model = _quantize_for_cpu(_bark_model)
+
+    # KV caching for the autoregressive semantic and coarse stages, so code
+    # paths that bypass the generate() kwargs still reuse past attention.
+    # The fine stage is non-autoregressive and has no cache. The pad token
+    # is set here once rather than passed to every generate() call.
+    gen_config = _bark_model.generation_config
+    gen_config.use_cache = True
+    gen_config.pad_token_id = _BARK_PAD_TOKEN_ID
+    for stage_config in (gen_config.semantic_config, gen_config.coarse_acoustics_config):
+        stage_config["use_cache"] = True
+        stage_config["pad_token_id"] = _BARK_PAD_TOKEN_ID
+
     _bark_sampling_rate = _resolve_sampling_rate(_bark_model)
+    _bark_voice_preset = _load_voice_preset(BARK_VOICE_PRESET)
+
+    if use_cuda:
+        _compile_bark_submodels()
+
+    _bark_ready = True
+
+
+def _quantize_for_cpu(model: BarkModel) -> BarkModel:
+    """
+    Dynamically quantize the Linear layers to int8 so CPU generation reads
+    a quarter of the weight bytes per forward. PyTorch's CPU dynamic
+    quantization has no 4-bit Linear kernel, so "int4" also uses int8.
+    """
+    if BARK_QUANTIZE == "off":
+        return model
+    if BARK_QUANTIZE not in ("int8", "int4"):
+        print(f"Warning: unknown BARK_QUANTIZE={BARK_QUANTIZE!r}; using fp32 weights.")
+        return model
+    if BARK_QUANTIZE == "int4":
+        print("Warning: 4-bit Bark weights need a GPU; quantizing to int8 instead.")
+
+    try:
+        # In place, so the fp32 model isn't deep-copied first
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    except Exception as e:
+        # Layers swapped before the failure stay int8; the rest stay fp32
+        print(f"Warning: int8 quantization of Bark failed ({e}); using remaining fp32 weights.")
+        return model
+
+
+def _load_voice_preset(preset: str) -> Optional[Dict[str, torch.Tensor]]:
+    """
+    Load the speaker prompt (.npz history arrays) once and keep it on the
+    model device, so requests don't re-read it from disk / the Hub.
+    The arrays are token ids, so they keep their integer dtype.
+    """
+    assert _bark_processor is not None and _bark_device is not None
+
+    try:
+        arrays = _bark_processor._load_voice_preset(preset)
+    except Exception as e:
+        print(f"Warning: Bark voice preset {preset!r} unavailable ({e}); using no preset.")
+        return None
+
+    return {key: torch.from_numpy(value).to(_bark_device) for key, value in arrays.items()}
+
+
+def _compile_bark_submodels():
+    """
+    torch.compile the three Bark transformers and the Encodec decoder, then
+    run one tiny generation so the Inductor cache is warm before the first
+    real request. Reverts to eager mode if compilation fails.
+
+    Dynamic-shape work (the growing KV cache of the semantic / coarse loops,
+    and the per-row decoder lengths) is compiled without CUDA Graphs:
+    "reduce-overhead" would record a new graph for every distinct size and
+    keep them all alive in VRAM.
+    """
+    assert _bark_model is not None
+
+    # BarkModel.generate calls each stage's own generate(), which calls
+    # self.forward, so compile the forwards rather than wrapping the modules.
+    stages = (_bark_model.semantic, _bark_model.coarse_acoustics, _bark_model.fine_acoustics)
+    eager_forwards = [stage.forward for stage in stages]
+    eager_decoder = _bark_model.codec_model.decoder
+
+    compile_options = (
+        dict(mode="default", dynamic=True),  # semantic
+        dict(mode="default", dynamic=True),  # coarse
+        dict(mode="default", dynamic=True),  # fine
+    )
+
+    for stage, forward, options in zip(stages, eager_forwards, compile_options):
+        stage.forward = torch.compile(forward, fullgraph=False, **options)
+
+    if BARK_CUDA_GRAPHS:
+        _bark_model.fine_acoustics.forward = _graph_fine_forward(eager_forwards[2])
+
+    _bark_model.codec_model.decoder = torch.compile(
+        eager_decoder, mode="default", fullgraph=False, dynamic=True
+    )
+
+    try:
+        with torch.inference_mode(), torch.autocast(device_type="cuda", dtype=torch.float16):
+            _bark_model.generate(
+                **_prepare_bark_inputs(["hi"]),
+                history_prompt=_bark_voice_preset,
+                semantic_max_new_tokens=16,
+            )
+    except Exception as e:
+        print(f"Warning: torch.compile of Bark failed ({e}); using eager mode.")
+        for stage, forward in zip(stages, eager_forwards):
+            stage.forward = forward
+        _bark_model.codec_model.decoder = eager_decoder
+
+
+def _graph_fine_forward(eager_forward):
+    """
+    Compile the fine stage for CUDA Graph replay. Its 1024-frame window is
+    fixed, but forward() picks lm_heads[codebook_idx - n_codes_given], so
+    Dynamo keeps one entry per codebook, and the batch size (one row per
+    lyric chunk) varies per job. Only the batch dimension is marked
+    dynamic, giving one compiled entry per (codebook, batch == 1 or not)
+    while the graph trees record one graph per concrete batch size.
+    Graphs are recorded per thread, so the warm-up in
+    _compile_bark_submodels (run on the loading thread) doesn't capture
+    them; the first request does.
+    """
+    config = _bark_model.fine_acoustics.config
+    n_codebooks = config.n_codes_total - config.n_codes_given
+    # Batch 1 can't be marked dynamic (Dynamo specializes sizes 0/1), so it
+    # compiles separately: two entries per codebook, plus headroom
+    dynamo_config = torch._dynamo.config
+    dynamo_config.cache_size_limit = max(dynamo_config.cache_size_limit, 2 * n_codebooks + 4)
+
+    compiled = torch.compile(eager_forward, mode="reduce-overhead", fullgraph=False, dynamic=False)
+
+    def forward(codebook_idx, input_ids=None, *args, **kwargs):
+        if input_ids is not None and input_ids.size(0) > 1:
+            torch._dynamo.mark_dynamic(input_ids, 0)
+        return compiled(codebook_idx, input_ids, *args, **kwargs)
+
+    return forward
 
 
 def _resolve_sampling_rate(model: BarkModel) -> int:
@@ -75,9 +280,28 @@ def _resolve_sampling_rate(model: BarkModel) -> int:
     return 24_000
 
 
-def _prepare_bark_inputs(text: str) -> Dict[str, torch.Tensor]:
+def _chunk_lyrics(lines: List[str]) -> List[str]:
+    """
+    Pack lyric lines into prompts of at most _MAX_CHUNK_CHARS characters,
+    breaking only between lines (overlong lines are truncated).
+    """
+    chunks: List[str] = []
+    current = ""
+    for line in lines:
+        candidate = f"{current} {line}" if current else line
+        if current and len(candidate) > _MAX_CHUNK_CHARS:
+            chunks.append(current)
+            candidate = line
+        current = candidate[:_MAX_CHUNK_CHARS]
+    if current:
+        chunks.append(current)
+    return chunks[:_MAX_CHUNKS]
+
+
+def _prepare_bark_inputs(texts: List[str]) -> Dict[str, torch.Tensor]:
     """
-    Tokenize text using the Bark processor with the same defaults the pipeline uses.
+    Tokenize a batch of prompts using the Bark processor with the same
+    defaults the pipeline uses (rows are padded to the same length).
     """
     assert _bark_model is not None and _bark_processor is not None and _bark_device is not None
 
@@ -89,21 +313,27 @@ def _prepare_bark_inputs(text: str) -> Dict[str, torch.Tensor]:
         "return_token_type_ids": False,
     }
 
-    encoded = _bark_processor([text], return_tensors="pt", **preprocess_kwargs)
+    encoded = _bark_processor(texts, return_tensors="pt", **preprocess_kwargs)
 
+    # On CUDA, copy from pinned host memory so the transfers are async
+    use_cuda = _bark_device.type == "cuda"
     moved: Dict[str, torch.Tensor] = {}
     for key, value in encoded.items():
         if isinstance(value, torch.Tensor):
-            moved[key] = value.to(_bark_device)
+            if use_cuda:
+                value = value.pin_memory()
+            moved[key] = value.to(_bark_device, non_blocking=use_cuda)
         else:
             moved[key] = value
 
     return moved
 
 
-def _postprocess_bark_audio(audio) -> np.ndarray:
+def _postprocess_bark_audio(audio) -> Tuple[torch.Tensor, float]:
     """
-    Normalize Bark's return type (list / tensor) to a numpy array with shape [T, C].
+    Normalize Bark's return type (list / tensor) to a float32 tensor with
+    shape [T], left on the generation device, along with its peak
+    amplitude (reduced on the device, so only a scalar is synced).
     """
     if isinstance(audio, tuple):
         audio = audio[0]
@@ -120,12 +350,31 @@ def _postprocess_bark_audio(audio) -> np.ndarray:
     if audio_tensor.ndim == 2 and audio_tensor.size(0) == 1:
         audio_tensor = audio_tensor.squeeze(0)
 
-    audio_np = audio_tensor.to(device="cpu", dtype=torch.float32).numpy()
+    audio_tensor = audio_tensor.to(dtype=torch.float32)
+    return audio_tensor, audio_tensor.abs().max().item()
 
-    if audio_np.ndim == 1:
-        audio_np = np.expand_dims(audio_np, axis=1)
 
-    return audio_np
+@lru_cache(maxsize=None)
+def _ensure_out_dir(out_dir: str) -> None:
+    # Output directories are fixed per deployment; create each one once
+    os.makedirs(out_dir, exist_ok=True)
+
+
+def _write_pcm16(out_path: str, audio: np.ndarray, sr: int) -> None:
+    # Quantize with vectorized NumPy rather than libsndfile's per-sample
+    # float conversion; runs on the writer thread
+    audio_i16 = np.clip(audio * 32767.0, -32768, 32767).astype(np.int16)
+    sf.write(out_path, audio_i16, sr, subtype="PCM_16")
+
+
+def wait_for_vocals(out_path: str) -> None:
+    """
+    Block until the background WAV write for out_path has finished,
+    re-raising any error from the writer thread.
+    """
+    future = _pending_writes.pop(out_path, None)
+    if future is not None:
+        future.result()
 
 
 def generate_vocals(
@@ -137,6 +386,9 @@ def generate_vocals(
     Generate a vocal 'song' rendition of the lyrics using Bark.
     This produces a single WAV file where a synthetic voice
     semi-sings / speaks the lyrics in an expressive way.
+
+    The WAV is written by a background thread; call wait_for_vocals() on
+    the returned path before reading or committing the file.
     """
     _ensure_bark_pipeline()
 
@@ -144,63 +396,70 @@ def generate_vocals(
 
     # Clean and prepare lyrics for Bark
     # Remove section headers and limit length
-    clean_lyrics = lyrics.replace("[Verse 1]", "").replace("[Verse 2]", "")
-    clean_lyrics = clean_lyrics.replace("[Chorus]", "").replace("[Bridge]", "")
-    clean_lyrics = clean_lyrics.strip()
-    
-    # Bark works best with 100-200 characters for clear speech
-    # Split into sentences and take first few
-    sentences = [s.strip() for s in clean_lyrics.split('\n') if s.strip()]
-    text_prompt = ' '.join(sentences[:3])[:250]  # Max 250 chars, ~3 sentences
-    
-    # Add voice preset for English speaker (critical for audio generation!)
-    text_prompt = f"♪ [clears throat] {text_prompt} ♪"
-    
-    print(f"Generating vocals for text: {text_prompt[:100]}...")
-    
-    inputs = _prepare_bark_inputs(text_prompt)
-    
-    # Add voice_preset for consistent, clear speech
-    # v2/en_speaker_6 is a clear English voice
-    if hasattr(_bark_processor, 'get_voice_preset'):
-        try:
-            voice_preset = _bark_processor.get_voice_preset("v2/en_speaker_6")
-            if voice_preset is not None:
-                inputs.update(voice_preset)
-        except:
-            pass  # Continue without preset if not available
-
-    with torch.inference_mode():
-        audio = _bark_model.generate(**inputs, pad_token_id=10000)
-
-    audio_np = _postprocess_bark_audio(audio)
+    clean_lyrics = _SECTION_RE.sub("", lyrics)
+
+    # Bark works best with 100-200 characters for clear speech, so split
+    # the full lyrics into line-aligned chunks and sing them as one batch
+    sentences = [s.strip() for s in clean_lyrics.splitlines() if s.strip()]
+    chunks = _chunk_lyrics(sentences) or [""]
+
+    # Musical notes cue Bark to sing rather than speak
+    text_prompts = [f"♪ {chunk} ♪" for chunk in chunks]
+    text_prompts[0] = f"♪ [clears throat] {chunks[0]} ♪"
+
+    print(f"Generating vocals for {len(text_prompts)} chunk(s): {text_prompts[0][:100]}...")
+
+    inputs = _prepare_bark_inputs(text_prompts)
+
+    # Add voice preset for consistent, clear speech (critical for audio generation!)
+    if _bark_voice_preset is not None:
+        inputs["history_prompt"] = _bark_voice_preset
+
+    # Cap semantic tokens by the longest prompt; passed per call so the
+    # shared generation config is never mutated between requests
+    semantic_max_new_tokens = int(max(map(len, text_prompts)) * _SEMANTIC_TOKENS_PER_CHAR)
+
+    with torch.inference_mode(), torch.autocast(
+        device_type="cuda", dtype=torch.float16, enabled=_bark_device.type == "cuda"
+    ):
+        audio, output_lengths = _bark_model.generate(
+            **inputs,
+            semantic_max_new_tokens=semantic_max_new_tokens,
+            use_cache=True,
+            do_sample=True,
+            min_eos_p=0.05,  # Let short prompts stop early
+            return_output_lengths=True,
+        )
+
+    # Rows are padded to the longest chunk; trim each to its own length and
+    # play the chunks back to back
+    audio = torch.cat([row[:length] for row, length in zip(audio, output_lengths)])
+
+    audio_tensor, max_amplitude = _postprocess_bark_audio(audio)
     sr = _bark_sampling_rate
-    
+
     # Check if audio is silent (all zeros or very low amplitude)
-    max_amplitude = np.abs(audio_np).max()
     print(f"Generated audio max amplitude: {max_amplitude}")
-    
+
     if max_amplitude < 0.001:
         print("WARNING: Generated audio appears to be silent!")
-        # Generate a simple tone as fallback to indicate audio was generated
-        duration = 2.0
-        t = np.linspace(0, duration, int(sr * duration))
-        fallback_audio = 0.1 * np.sin(2 * np.pi * 440 * t)  # 440 Hz tone
-        audio_np = np.expand_dims(fallback_audio, axis=1)
-
-    # Ensure shape is (T, C)
-    if audio_np.ndim == 1:
-        audio_np = np.expand_dims(audio_np, axis=1)  # [T, 1]
-
-    # Normalize audio to prevent clipping
-    max_val = np.abs(audio_np).max()
-    if max_val > 0:
-        audio_np = audio_np / max_val * 0.95  # Leave headroom
+        # Write a simple tone as fallback to indicate audio was generated
+        if sr == _FALLBACK_TONE_SR:
+            audio_np = _FALLBACK_TONE
+        else:
+            t = np.arange(2 * sr) / sr
+            audio_np = (0.95 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)[:, None]
+    else:
+        # Normalize in place on-device (leaving headroom) so only the final
+        # buffer is copied to the host; sf.write takes [T] as mono
+        audio_tensor.mul_(0.95 / max_amplitude)
+        audio_np = audio_tensor.contiguous().cpu().numpy()
 
-    os.makedirs(out_dir, exist_ok=True)
+    _ensure_out_dir(out_dir)
     out_path = os.path.join(out_dir, f"{job_id}_vocals.wav")
 
-    sf.write(out_path, audio_np, sr)
-    print(f"Audio saved to {out_path}, duration: {len(audio_np)/sr:.2f}s")
+    # 16-bit PCM is half the size of float32 WAV and decodes natively in browsers
+    _pending_writes[out_path] = _WRITER_POOL.submit(_write_pcm16, out_path, audio_np, sr)
+    print(f"Writing audio to {out_path}, duration: {len(audio_np)/sr:.2f}s")
 
     return out_path